@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
+import argparse
 import yaml
 import importlib
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 import shutil 
+from stages.sampling import set_sample_fraction, sample_suffix
 
 # Load config
 def load_config(config_path="config.yaml"):
@@ -31,15 +33,38 @@ def save_metadata(metadata_file, metadata):
   with open(metadata_file, "w") as f:
     yaml.dump(metadata, f)
 
+def parse_args():
+  parser = argparse.ArgumentParser(description="Run the Citi Bike data pipeline.")
+  parser.add_argument("--sample", type=float, metavar="FRACTION",
+                      help="Keep a deterministic fraction (0-1] of rides and write to a separate output root")
+  parser.add_argument("--fresh", action="store_true",
+                      help="Start over: ignore an unfinished previous run, clear work_dir and the stage checkpoints")
+  args = parser.parse_args()
+  if args.sample is not None and not 0 < args.sample <= 1:
+    parser.error("--sample must be in (0, 1]")
+  return args
+
 def main():
+  args = parse_args()
+
   # Load config
   config = load_config()
   input_dir = Path(config["input_dir"])
   output_dir = Path(config["output_dir"])
   work_dir = Path(config["work_dir"])
+  metadata_file = Path(config["metadata_file"])
+
+  # Sampled runs get their own output root, work_dir and metadata so they never mix with full runs
+  if args.sample is not None:
+    suffix = sample_suffix(args.sample)
+    output_dir = output_dir.with_name(output_dir.name + suffix)
+    work_dir = work_dir.with_name(work_dir.name + suffix)
+    metadata_file = metadata_file.with_name(metadata_file.stem + suffix + metadata_file.suffix)
+    set_sample_fraction(args.sample)
+    print(f"[SAMPLE] Keeping {args.sample:.2%} of rides, writing to {output_dir}")
+
   work_dir.mkdir(parents=True, exist_ok=True)
   output_dir.mkdir(parents=True, exist_ok=True)
-  metadata_file = Path(config["metadata_file"])
 
   # Setup logging
   logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -52,10 +77,18 @@ def main():
   now = datetime.now()
   resume = False
   last_run_str = metadata.get("last_run")
-  if last_run_str:
+  if args.fresh:
+    print("[FRESH] Ignoring any previous run and starting from the first stage.")
+  elif last_run_str:
     last_run_time = datetime.fromisoformat(last_run_str)
     if now - last_run_time < timedelta(hours=1):
       resume = True
+
+  # A run that stopped partway through is always resumed, however long ago it stopped. Its
+  # stages pick up from their checkpoint journals, so work_dir has to be kept.
+  if metadata.get("in_progress") and not args.fresh:
+    print(f"[RESUME] Previous run started {last_run_str} did not finish, resuming it (use --fresh to start over).")
+    resume = True
   
   completed_stages = set(metadata.get("completed_stages", []))
 
@@ -65,6 +98,11 @@ def main():
       print(f"[CLEAN] Removing previous work_dir contents at {work_dir}")
       shutil.rmtree(work_dir)
     work_dir.mkdir(parents=True, exist_ok=True)
+    completed_stages = set()
+
+  metadata["in_progress"] = True
+  metadata["completed_stages"] = list(completed_stages)
+  save_metadata(metadata_file, metadata)
 
   for stage in stages:
     if resume and stage.__name__ in completed_stages:
@@ -77,12 +115,16 @@ def main():
 
     if stage_exit == False:
       print(f"\n  - Error: Encountered an error in {stage.__name__}. Aborting.")
+      print("  - The next run resumes from this stage; run with --fresh to start over instead.")
       break
     else:
       completed_stages.add(stage.__name__)
       metadata["completed_stages"] = list(completed_stages)
       metadata["last_run"] = now.isoformat()
       save_metadata(metadata_file, metadata)
+  else:
+    metadata["in_progress"] = False
+    save_metadata(metadata_file, metadata)
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+# Local HTTP server for the visualization that builds station/month ride data on demand.
+#
+# Requests for data/stations/<prefix>/<station_id>/YYYY-MM-ridedata.json (the URL layout used
+#   by src/js/stationManager.js) are answered from the station/month CSVs written by
+#   stages 04/05, using the same conversion as stage_06. Responses are kept in a size-bounded
+#   LRU cache and carry an ETag derived from the source file, so repeat requests are answered
+#   with 304 Not Modified. Every other path is served as a static file from src/.
+#
+# With --mode precomputed the same server serves the JSON files written by stage_06 instead,
+#   so both approaches can be compared under the same load test. Cache and latency numbers
+#   for either mode are available at /stats.
+#
+# Data layout after a full pipeline run (--data-dir overrides the default for the mode):
+#   on-demand:   <output_dir>-intermediate/<prefix>/<station_id>/YYYY-MM-ridedata.csv (+ .csv.idx),
+#                moved there by stage_10 (see stages/intermediate.py)
+#   precomputed: <output_dir>/<prefix>/<station_id>/YYYY-MM-ridedata.json (+ .json.idx, .sketch.json)
+#   Before stage_10 has run, the CSVs are still in <output_dir>; pass --data-dir to use them there.
+
+import argparse
+import asyncio
+import io
+import json
+import mimetypes
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from run_pipeline import load_config
+from stages.stage_06_convert_to_json import write_output_data
+from stages.intermediate import get_intermediate_dir
+
+STATION_PATH = re.compile(r"^/data/stations/([^/]+)/([^/]+)/(\d{4}-\d{2})-ridedata\.json$")
+LATENCY_WINDOW = 10000
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error"}
+
+# Runs in a worker process: build the JSON body for one station/month CSV
+def render_station_month(csv_path):
+    buffer = io.StringIO()
+    write_output_data(Path(csv_path), buffer)
+    return buffer.getvalue().encode("utf-8")
+
+# Runs in a worker process: read an already rendered JSON file
+def read_station_month(json_path):
+    with open(json_path, "rb") as f:
+        return f.read()
+
+def get_etag(path):
+    st = os.stat(path)
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+# Size-bounded LRU cache of {key: (etag, body)}
+class ResponseCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def get(self, key, etag):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != etag:
+            # Source file changed since this response was built
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        self.pop(key)
+        self.entries[key] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+class StationDataServer:
+    def __init__(self, data_dir, static_root, mode, cache_bytes, workers):
+        self.data_dir = Path(data_dir).resolve()
+        self.static_root = Path(static_root).resolve()
+        self.mode = mode
+        self.cache = ResponseCache(cache_bytes)
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.in_flight = {}
+        self.counters = {"requests": 0, "hits": 0, "misses": 0, "not_modified": 0,
+                         "not_found": 0, "errors": 0}
+        self.latencies = {"hit": deque(maxlen=LATENCY_WINDOW), "miss": deque(maxlen=LATENCY_WINDOW)}
+
+    # Source file for a station/month request in the current mode
+    def source_path(self, prefix, station_id, month):
+        suffix = ".json" if self.mode == "precomputed" else ".csv"
+        path = (self.data_dir / prefix / station_id / f"{month}-ridedata{suffix}").resolve()
+        if self.data_dir not in path.parents:
+            return None
+        return path
+
+    async def station_month(self, prefix, station_id, month, if_none_match):
+        path = self.source_path(prefix, station_id, month)
+        if path is None or not path.is_file():
+            self.counters["not_found"] += 1
+            return 404, {}, b"Not Found", None
+
+        etag = get_etag(path)
+        headers = {"ETag": etag, "Content-Type": "application/json", "Cache-Control": "no-cache"}
+        if if_none_match == etag:
+            self.counters["not_modified"] += 1
+            return 304, headers, b"", None
+
+        key = str(path)
+        body = self.cache.get(key, etag)
+        if body is not None:
+            self.counters["hits"] += 1
+            return 200, headers, body, "hit"
+
+        self.counters["misses"] += 1
+        # Concurrent misses for the same file share a single build
+        future = self.in_flight.get(key)
+        if future is None:
+            build = read_station_month if self.mode == "precomputed" else render_station_month
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, build, key)
+            self.in_flight[key] = future
+            try:
+                body = await future
+            finally:
+                del self.in_flight[key]
+            self.cache.put(key, etag, body)
+        else:
+            body = await asyncio.shield(future)
+        return 200, headers, body, "miss"
+
+    def static_file(self, path):
+        relative = path.lstrip("/") or "index.html"
+        file_path = (self.static_root / relative).resolve()
+        if self.static_root not in file_path.parents or not file_path.is_file():
+            self.counters["not_found"] += 1
+            return 404, {}, b"Not Found"
+        content_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+        return 200, {"Content-Type": content_type}, file_path.read_bytes()
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"]
+        latency = {}
+        for kind, values in self.latencies.items():
+            ordered = sorted(values)
+            latency[kind] = {
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else None,
+                "p50_ms": percentile(ordered, 0.50),
+                "p90_ms": percentile(ordered, 0.90),
+                "p99_ms": percentile(ordered, 0.99),
+            }
+        return {
+            "mode": self.mode,
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else None,
+            "cache": {
+                "entries": len(self.cache.entries),
+                "bytes": self.cache.size,
+                "max_bytes": self.cache.max_bytes,
+                "evictions": self.cache.evictions,
+            },
+            "latency": latency,
+        }
+
+    async def dispatch(self, method, target, headers):
+        if method not in ("GET", "HEAD"):
+            return 405, {}, b"Method Not Allowed"
+
+        path = unquote(urlsplit(target).path)
+        if path == "/stats":
+            return 200, {"Content-Type": "application/json"}, json.dumps(self.stats()).encode("utf-8")
+
+        match = STATION_PATH.match(path)
+        if match:
+            start = time.perf_counter()
+            status, response_headers, body, kind = await self.station_month(*match.groups(), headers.get("if-none-match"))
+            if kind:
+                self.latencies[kind].append((time.perf_counter() - start) * 1000.0)
+            return status, response_headers, body
+
+        return self.static_file(path)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, "GET", 400, {}, b"Bad Request", False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                self.counters["requests"] += 1
+                try:
+                    status, response_headers, body = await self.dispatch(method, target, headers)
+                except Exception as e:
+                    print(f"[ERROR] {method} {target}: {e}")
+                    self.counters["errors"] += 1
+                    status, response_headers, body = 500, {}, b"Internal Server Error"
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.respond(writer, method, status, response_headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, method, status, headers, body, keep_alive):
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}"]
+        # A 304 has no body, and a Content-Length on it would have to match the full 200 response
+        if status != 304:
+            headers = {"Content-Length": str(len(body)), **headers}
+        headers = {**headers, "Connection": "keep-alive" if keep_alive else "close"}
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if method != "HEAD":
+            writer.write(body)
+        await writer.drain()
+
+async def serve(args):
+    config = load_config(args.config)
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = config["output_dir"] if args.mode == "precomputed" else get_intermediate_dir(config["output_dir"])
+    server = StationDataServer(data_dir, args.static_root, args.mode,
+                               args.cache_mb * 1024 * 1024, args.workers)
+
+    source = "*-ridedata.json" if args.mode == "precomputed" else "*-ridedata.csv"
+    if not any(Path(data_dir).glob(f"*/*/{source}")):
+        print(f"Warning: no {source} files found under {data_dir}")
+
+    listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+    print(f"Serving {args.mode} station data from {data_dir} on http://{args.host}:{args.port}/ (stats at /stats)")
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve station/month ride data for the visualization.")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--data-dir", help="Directory holding <prefix>/<station_id>/ files (default: output_dir from config in "
+                             "precomputed mode, its -intermediate sibling in on-demand mode)")
+    parser.add_argument("--static-root", default=str(Path(__file__).resolve().parent.parent / "src"))
+    parser.add_argument("--mode", choices=["on-demand", "precomputed"], default="on-demand")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-mb", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
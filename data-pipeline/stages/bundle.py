@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# On-disk format and reader for the per-month bundles written by stage_11.
+#
+# bundles/YYYY-MM-ridedata.bundle is every station's YYYY-MM-ridedata.json for that month,
+#   concatenated byte for byte. bundles/YYYY-MM-ridedata.bundle.idx is a small JSON index:
+#     {"bundle": "YYYY-MM-ridedata.bundle", "stations": {"<station_id>": [offset, length, days], ...}}
+#   so a single station can be fetched with one seek, or one HTTP request with
+#   "Range: bytes=<offset>-<offset + length - 1>".
+#
+# days is the station's per-day list from its YYYY-MM-ridedata.json.idx (see day_index.py), with
+#   offsets relative to the start of the station's JSON. A day's rides are therefore at
+#   bundle offset <offset + day.offset>, <day.length> bytes long, and a client never needs the
+#   per-station index files.
+#
+# bundles/YYYY-MM-ridedata.sketches.json holds every station's YYYY-MM-ridedata.sketch.json
+#   for the month, keyed by station_id, in place of the per-station sketch sidecars.
+
+import json
+from pathlib import Path
+
+from stages.day_index import filter_hours
+
+def get_bundle_path(month, bundle_dir):
+    return Path(bundle_dir) / f"{month}-ridedata.bundle"
+
+def get_index_path(bundle_path):
+    bundle_path = Path(bundle_path)
+    return bundle_path.with_name(bundle_path.name + ".idx")
+
+def get_sketches_path(month, bundle_dir):
+    return Path(bundle_dir) / f"{month}-ridedata.sketches.json"
+
+def load_bundle_index(bundle_path):
+    with open(get_index_path(bundle_path), 'r', encoding='utf-8') as f:
+        return json.load(f)["stations"]
+
+# Read one station's raw JSON payload without reading the rest of the bundle
+def read_bundle_entry(bundle_path, station_id, index=None):
+    index = index or load_bundle_index(bundle_path)
+    if station_id not in index:
+        return None
+    offset, length, _ = index[station_id]
+    with open(bundle_path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+def load_station_month(bundle_path, station_id, index=None):
+    payload = read_bundle_entry(bundle_path, station_id, index)
+    return None if payload is None else json.loads(payload)
+
+# Read one station's rides for the days in [first_day, last_day], like day_index.read_json_rides
+def read_bundle_rides(bundle_path, station_id, first_day, last_day=None, hours=None, index=None):
+    index = index or load_bundle_index(bundle_path)
+    if station_id not in index:
+        return []
+    offset, _, days = index[station_id]
+    selected = [d for d in days if first_day <= d['day'] <= (last_day or first_day)]
+    if not selected:
+        return []
+
+    start = offset + selected[0]['offset']
+    end = offset + selected[-1]['offset'] + selected[-1]['length']
+    with open(bundle_path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+    return filter_hours(json.loads(b'[' + chunk + b']'), hours)
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Per-stage work unit journal so an interrupted stage resumes where it stopped.
+#
+# Each parallel stage records a unit (a ZIP, a station/month file, a month, ...) once all of its
+#   outputs are written, as one JSON line in work_dir/.checkpoints/<stage>.jsonl listing the
+#   output files and their sizes. On a resumed run the stage skips any unit whose outputs still
+#   exist with the recorded sizes and redoes everything else. Only the stage's parent process
+#   writes to the journal; workers return their results as usual.
+#
+# The journals are pipeline state, not published data, so they live in work_dir: run_pipeline.py
+#   keeps work_dir when it resumes a run and wipes it, journals included, when it starts a fresh one.
+
+import json
+import os
+from pathlib import Path
+
+CHECKPOINT_DIR = ".checkpoints"
+
+def get_checkpoint_dir(work_dir):
+    return Path(work_dir) / CHECKPOINT_DIR
+
+class Journal:
+    def __init__(self, work_dir, stage_name):
+        checkpoint_dir = get_checkpoint_dir(work_dir)
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.path = checkpoint_dir / f"{stage_name.rsplit('.', 1)[-1]}.jsonl"
+        self.entries = {}
+
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crash while appending can leave a truncated last line
+                        continue
+                    self.entries[entry["unit"]] = entry
+
+    # True if the unit was recorded and all of its outputs are still intact
+    def is_done(self, unit):
+        entry = self.entries.get(str(unit))
+        if entry is None:
+            return False
+        for path, size in entry["outputs"]:
+            try:
+                if os.stat(path).st_size != size:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    def record(self, unit, outputs):
+        entry = {
+            "unit": str(unit),
+            "outputs": [[str(path), os.stat(path).st_size] for path in outputs]
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[entry["unit"]] = entry
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
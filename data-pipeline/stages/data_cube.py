@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# On-disk format and query helpers for the monthly ride count cube built by stage_09.
+#
+# YYYY-MM-cube.npy is a dense uint32 array saved with np.save so it can be memory-mapped,
+#   with the axes listed in AXES:
+#     direction  0 = departures, 1 = arrivals
+#     station    integer station code (see station_codes.py)
+#     hour       hour of started_at, 0-23
+#     weekday    weekday of started_at, 0 = Monday
+#     member     0 = casual, 1 = member
+#     bike       0 = classic_bike, 1 = electric_bike
+#   YYYY-MM-cube.json holds the station IDs for the station axis.
+#
+# Arrivals are bucketed by started_at like the hourly histogram in the UI, and a ride that
+#   starts and ends at the same station counts as both a departure and an arrival there.
+
+import json
+from pathlib import Path
+import numpy as np
+
+AXES = ("direction", "station", "hour", "weekday", "member", "bike")
+DIRECTIONS = {"departures": 0, "arrivals": 1}
+
+def get_cube_paths(month, output_dir):
+    output_dir = Path(output_dir)
+    return output_dir / f"{month}-cube.npy", output_dir / f"{month}-cube.json"
+
+def empty_station_cube():
+    return np.zeros((2, 24, 7, 2, 2), dtype=np.uint32)
+
+def save_cube(month, output_dir, station_ids, cube):
+    cube_path, meta_path = get_cube_paths(month, output_dir)
+    np.save(cube_path, cube)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({"month": month, "axes": list(AXES), "station_ids": list(station_ids)}, f)
+
+def load_cube(month, output_dir, mmap=True):
+    cube_path, meta_path = get_cube_paths(month, output_dir)
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return DataCube(np.load(cube_path, mmap_mode='r' if mmap else None), meta["station_ids"])
+
+class DataCube:
+    def __init__(self, counts, station_ids):
+        self.counts = counts
+        self.station_ids = station_ids
+        self.codes = {station_id: code for code, station_id in enumerate(station_ids)}
+
+    # Sum ride counts matching the filters, keeping the axes named in `by` in AXES order.
+    #   Each filter is a single value or a list of values; station filters take station IDs
+    #   and direction takes "departures"/"arrivals" or 0/1.
+    #   e.g. cube.sum(direction="departures", station="5329.03", weekday=[5, 6],
+    #                 member=0, bike=1, by=["hour"])
+    def sum(self, by=(), **filters):
+        unknown = set(filters) - set(AXES)
+        if unknown:
+            raise ValueError(f"Unknown cube axes: {sorted(unknown)}")
+        unknown = set(by) - set(AXES)
+        if unknown:
+            raise ValueError(f"Unknown cube axes: {sorted(unknown)}")
+
+        result = self.counts
+        # Select from the last axis first so earlier axis numbers stay valid
+        for axis in reversed(range(len(AXES))):
+            value = filters.get(AXES[axis])
+            if value is None:
+                continue
+            indices = np.atleast_1d(self._indices(AXES[axis], value))
+            result = np.take(result, indices, axis=axis)
+
+        summed = tuple(axis for axis, name in enumerate(AXES) if name not in by)
+        return result.sum(axis=summed, dtype=np.int64)
+
+    def _indices(self, axis, value):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if axis == "station":
+            return [self.codes[v] for v in values]
+        if axis == "direction":
+            indices = [DIRECTIONS.get(v, v) for v in values]
+            unknown = [v for v, i in zip(values, indices) if i not in DIRECTIONS.values()]
+            if unknown:
+                raise ValueError(f"Unknown directions: {unknown}, expected one of "
+                                 f"{list(DIRECTIONS) + sorted(DIRECTIONS.values())}")
+            return indices
+        return values
+
+    # The [inbound, outbound] hourly counts shown in the station panel histogram
+    def hourly_histogram(self, station_id):
+        hourly = self.sum(station=station_id, by=["direction", "hour"])
+        return [hourly[DIRECTIONS["arrivals"]].tolist(), hourly[DIRECTIONS["departures"]].tolist()]
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Helpers for station/month files sorted by started_at.
+#
+# Every sorted CSV and every published ride JSON gets a small JSON sidecar
+#   (YYYY-MM-ridedata.csv.idx / YYYY-MM-ridedata.json.idx) listing where each day's rides live
+#   in the file, so a day can be read with a single seek or HTTP Range request instead of
+#   scanning the whole month:
+#     {"header_length": 123,
+#      "days": [{"day": "2024-01-01", "offset": 123, "length": 4567, "row": 0, "rows": 42}, ...]}
+#   offset/length are in bytes, row/rows are positions in the rides (CSV header excluded).
+#   In the JSON, a day's byte range is its ride objects separated by commas, so wrapping the
+#   range in [ and ] gives a valid JSON array.
+
+import csv
+import io
+import json
+import os
+from pathlib import Path
+
+def get_index_path(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + ".idx")
+
+# Sort key for rows; the timestamp format sorts correctly as a string
+def started_at_key(row):
+    return row['started_at']
+
+# Record one more ride of `length` bytes at `offset` in a list of per-day entries
+def track_day(days, day, offset, length, row_number):
+    if not days or days[-1]['day'] != day:
+        days.append({"day": day, "offset": offset, "length": 0, "row": row_number, "rows": 0})
+    days[-1]['length'] = offset + length - days[-1]['offset']
+    days[-1]['rows'] += 1
+
+def save_day_index(path, header_length, days):
+    with open(get_index_path(path), 'w', encoding='utf-8') as f_idx:
+        json.dump({"header_length": header_length, "days": days}, f_idx)
+
+# Encode a single CSV record the same way csv.DictWriter would
+def encode_row(writer, buffer, row):
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerow(row)
+    return buffer.getvalue().encode('utf-8')
+
+# Write rows that are already sorted by started_at along with their per-day index. Both files are
+#   written to temp files first and renamed into place, so the CSV can be rewritten in place.
+def write_sorted_csv(csv_path, fieldnames, rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    days = []
+    index_path = get_index_path(csv_path)
+    tmp_csv = Path(f"{csv_path}.tmp")
+    tmp_index = get_index_path(tmp_csv)
+
+    with open(tmp_csv, 'wb') as f_out:
+        writer.writeheader()
+        header = buffer.getvalue().encode('utf-8')
+        f_out.write(header)
+        offset = len(header)
+
+        for row_number, row in enumerate(rows):
+            encoded = encode_row(writer, buffer, row)
+            f_out.write(encoded)
+            track_day(days, row['started_at'][:10], offset, len(encoded), row_number)
+            offset += len(encoded)
+
+    save_day_index(tmp_csv, len(header), days)
+
+    os.replace(tmp_csv, csv_path)
+    os.replace(tmp_index, index_path)
+
+def load_day_index(path):
+    with open(get_index_path(path), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Read the raw bytes covering the days in [first_day, last_day], or None if none of them have rides
+def read_day_range(path, first_day, last_day=None):
+    last_day = last_day or first_day
+    index = load_day_index(path)
+    selected = [d for d in index['days'] if first_day <= d['day'] <= last_day]
+    if not selected:
+        return index, None
+
+    start = selected[0]['offset']
+    end = selected[-1]['offset'] + selected[-1]['length']
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return index, f.read(end - start)
+
+def filter_hours(rides, hours):
+    if hours is None:
+        return rides
+    hours = set(hours)
+    return [r for r in rides if int(r['started_at'][11:13]) in hours]
+
+# Read the rows for the days in [first_day, last_day] (YYYY-MM-DD strings), optionally
+#   limited to a set of start hours, without reading the rest of the file
+def read_rows(csv_path, first_day, last_day=None, hours=None):
+    index, chunk = read_day_range(csv_path, first_day, last_day)
+    if chunk is None:
+        return []
+    with open(csv_path, 'rb') as f:
+        header = f.read(index['header_length'])
+
+    lines = io.StringIO((header + chunk).decode('utf-8'), newline='')
+    return filter_hours(list(csv.DictReader(lines)), hours)
+
+# Same as read_rows, for a published YYYY-MM-ridedata.json
+def read_json_rides(json_path, first_day, last_day=None, hours=None):
+    _, chunk = read_day_range(json_path, first_day, last_day)
+    if chunk is None:
+        return []
+    return filter_hours(json.loads(b'[' + chunk + b']'), hours)
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# Location of the intermediate files kept after a run.
+#
+# The sorted station/month CSVs and their day indexes (YYYY-MM-ridedata.csv/.csv.idx, see
+#   day_index.py) are not published, but serve.py's on-demand mode builds its responses from
+#   them. stage_10 moves them out of the output folder into a sibling root named
+#   <output_dir>-intermediate, keeping the same <prefix>/<station_id>/ layout.
+#
+# Other pipeline state that must outlive work_dir but not be published, such as stage_01's
+#   validation cache, is kept at the top of the same root.
+
+from pathlib import Path
+
+def get_intermediate_dir(output_dir):
+    output_dir = Path(output_dir)
+    return output_dir.with_name(output_dir.name + "-intermediate")
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# On-disk format and helpers for the monthly origin-destination (OD) matrix.
+#
+# Each YYYY-MM-od-matrix.npz holds a CSR-style sparse matrix where row i is the start
+#   station and column j the end station (integer codes, see station_codes.py):
+#     station_ids  - station ID for each code
+#     indptr       - row pointers, length n_stations + 1
+#     indices      - end station code for each stored entry
+#     data         - ride counts with shape (nnz, 2, 2) indexed by [member_casual, rideable_type]
+#                    using the same 0/1 coding as stage_04 (1 = member / electric_bike)
+#
+# Row sums are departures from a station and column sums are arrivals. Rides that start
+#   and end at the same station sit on the diagonal.
+
+from collections import Counter
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Build a matrix from {start_code: Counter of (end_code, member, bike) -> count}
+def build_od_matrix(station_ids, rows):
+    n = len(station_ids)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indices = []
+    data = []
+
+    for code in range(n):
+        by_end = {}
+        for (end_code, member, bike), count in rows.get(code, Counter()).items():
+            by_end.setdefault(end_code, np.zeros((2, 2), dtype=np.uint32))[member, bike] += count
+        for end_code in sorted(by_end):
+            indices.append(end_code)
+            data.append(by_end[end_code])
+        indptr[code + 1] = len(indices)
+
+    return ODMatrix(
+        np.asarray(station_ids),
+        indptr,
+        np.asarray(indices, dtype=np.int32),
+        np.asarray(data, dtype=np.uint32).reshape(-1, 2, 2),
+    )
+
+def save_od_matrix(path, matrix):
+    np.savez_compressed(
+        path,
+        format_version=np.int32(FORMAT_VERSION),
+        station_ids=matrix.station_ids,
+        indptr=matrix.indptr,
+        indices=matrix.indices,
+        data=matrix.data,
+    )
+
+def load_od_matrix(path):
+    with np.load(path) as npz:
+        version = int(npz["format_version"])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported OD matrix format version {version} in {path}")
+        return ODMatrix(npz["station_ids"], npz["indptr"], npz["indices"], npz["data"])
+
+class ODMatrix:
+    def __init__(self, station_ids, indptr, indices, data):
+        self.station_ids = station_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.codes = {str(station_id): code for code, station_id in enumerate(station_ids)}
+
+    @property
+    def n_stations(self):
+        return len(self.station_ids)
+
+    # Start station code for every stored entry
+    def row_indices(self):
+        return np.repeat(np.arange(self.n_stations, dtype=np.int32), np.diff(self.indptr))
+
+    # Ride counts per stored entry, optionally restricted to one rider and/or bike type
+    def counts(self, member=None, bike=None):
+        data = self.data.astype(np.int64)
+        data = data.sum(axis=1) if member is None else data[:, member, :]
+        data = data.sum(axis=1) if bike is None else data[:, bike]
+        return data
+
+    # Row sums: rides leaving each station (including rides that loop back to it)
+    def outbound(self, member=None, bike=None):
+        return np.bincount(self.row_indices(), weights=self.counts(member, bike),
+                           minlength=self.n_stations).astype(np.int64)
+
+    # Column sums: rides arriving at each station (including rides that loop back to it)
+    def inbound(self, member=None, bike=None):
+        return np.bincount(self.indices, weights=self.counts(member, bike),
+                           minlength=self.n_stations).astype(np.int64)
+
+    # Rides that start and end at the same station
+    def loops(self, member=None, bike=None):
+        mask = self.row_indices() == self.indices
+        return np.bincount(self.indices[mask], weights=self.counts(member, bike)[mask],
+                           minlength=self.n_stations).astype(np.int64)
+
+    # Per-station totals matching the stage_06 summary, which does not count loops
+    def summary(self, station_id, member=None, bike=None):
+        code = self.codes[station_id]
+        loops = self.loops(member, bike)[code]
+        total_inbound = int(self.inbound(member, bike)[code] - loops)
+        total_outbound = int(self.outbound(member, bike)[code] - loops)
+        return {
+            "total_inbound": total_inbound,
+            "total_outbound": total_outbound,
+            "flux": total_inbound - total_outbound
+        }
+
+    # Most common (start_station_id, end_station_id, count) routes
+    def top_routes(self, n=50, member=None, bike=None, include_loops=False):
+        rows = self.row_indices()
+        counts = self.counts(member, bike)
+        keep = counts > 0
+        if not include_loops:
+            keep &= rows != self.indices
+        entries = np.flatnonzero(keep)
+        # Stable sort so ties keep row-major (start, end) order
+        order = entries[np.argsort(-counts[entries], kind="stable")][:n]
+        return [
+            (str(self.station_ids[rows[i]]), str(self.station_ids[self.indices[i]]), int(counts[i]))
+            for i in order
+        ]
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# Deterministic ride sampling used by run_pipeline.py --sample.
+#
+# A ride is kept when a hash of its ride_id falls below the sample fraction, so the same rides
+#   are kept by every stage that reads the input ZIPs and by every run with the same fraction.
+#   Stages that read the raw rides call get_sample_fraction() in run() and pass the value on
+#   to their workers.
+
+import hashlib
+
+_sample_fraction = None
+
+def set_sample_fraction(fraction):
+    global _sample_fraction
+    _sample_fraction = fraction
+
+def get_sample_fraction():
+    return _sample_fraction
+
+def keep_ride(row, fraction):
+    if fraction is None or fraction >= 1:
+        return True
+    # Older exports have no ride_id, fall back to fields that identify the ride
+    key = row.get('ride_id') or f"{row.get('started_at')}|{row.get('start_station_id')}|{row.get('end_station_id')}"
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') < fraction * 2**64
+
+# Suffix used for the separate output root, work_dir and metadata file of a sampled run
+def sample_suffix(fraction):
+    return f"-sample-{fraction:g}"
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
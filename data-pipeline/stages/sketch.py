@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# Mergeable quantile sketch (a merging t-digest) for ride_time and ride_distance.
+#
+# stage_06 builds one digest per field for every station/month while it writes the ride JSON
+#   and saves them to YYYY-MM-ridedata.sketch.json next to it. Digests merge without any loss
+#   beyond the sketch's own error, so system-wide and yearly distributions are built from
+#   the station/month sketches instead of rescanning rides.
+#
+# A ride is in the CSVs of both its start and end station, so a station/month sidecar holds two
+#   sets of digests: "all" covers every ride in the station's file, "departures" only the rides
+#   that start there (direction 0 or 2). Only the departures are merged across stations, which
+#   counts every ride exactly once.
+
+import json
+from math import asin, pi, inf
+
+SKETCH_FIELDS = ['ride_time', 'ride_distance']
+SUMMARY_QUANTILES = {'p50': 0.50, 'p90': 0.90, 'p99': 0.99}
+
+class TDigest:
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []  # sorted [mean, weight] pairs
+        self.buffer = []
+        self.count = 0
+        self.min = inf
+        self.max = -inf
+
+    def add(self, value, weight=1):
+        self.buffer.append([value, weight])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= 10 * self.compression:
+            self.compress()
+
+    def merge(self, other):
+        other.compress()
+        if not other.count:
+            return self
+        self.buffer.extend([mean, weight] for mean, weight in other.centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+        return self
+
+    # Scale function k1: centroids near the tails stay small so extreme quantiles stay accurate
+    def _k(self, q):
+        return self.compression / (2 * pi) * asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged = [list(points[0])]
+        weight_before = 0
+        k_lower = self._k(0)
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            if self._k((weight_before + current[1] + weight) / total) - k_lower <= 1:
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                weight_before += current[1]
+                k_lower = self._k(weight_before / total)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        self.compress()
+        if not self.count:
+            return None
+        # Interpolate between centroid centres, pinned to the observed min and max
+        positions = [0.0]
+        values = [self.min]
+        cumulative = 0
+        for mean, weight in self.centroids:
+            positions.append(cumulative + weight / 2)
+            values.append(mean)
+            cumulative += weight
+        positions.append(cumulative)
+        values.append(self.max)
+
+        target = q * cumulative
+        for i in range(1, len(positions)):
+            if target <= positions[i]:
+                span = positions[i] - positions[i - 1]
+                if span <= 0:
+                    return values[i]
+                fraction = (target - positions[i - 1]) / span
+                return values[i - 1] + fraction * (values[i] - values[i - 1])
+        return self.max
+
+    def summary(self):
+        return {name: None if self.quantile(q) is None else round(self.quantile(q), 1)
+                for name, q in SUMMARY_QUANTILES.items()}
+
+    def to_dict(self):
+        self.compress()
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "centroids": [[round(mean, 3), weight] for mean, weight in self.centroids]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data["compression"])
+        digest.centroids = [list(c) for c in data["centroids"]]
+        digest.count = data["count"]
+        if digest.count:
+            digest.min = data["min"]
+            digest.max = data["max"]
+        return digest
+
+def new_sketches():
+    return {field: TDigest() for field in SKETCH_FIELDS}
+
+def sketch_entries(sketches):
+    return {field: {"summary": digest.summary(), "sketch": digest.to_dict()}
+            for field, digest in sketches.items()}
+
+def save_sketches(path, sketches):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(sketch_entries(sketches), f)
+
+def save_station_sketches(path, sketches, departures):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"all": sketch_entries(sketches), "departures": sketch_entries(departures)}, f)
+
+# Load a system-wide sketch file, or the departures of a station/month sidecar
+def load_sketches(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data = data.get("departures", data)
+    return {field: TDigest.from_dict(entry["sketch"]) for field, entry in data.items()}
+
+# Merge any number of saved sketch files, e.g. all stations of a month or all months of a year
+def merge_sketch_files(paths):
+    merged = new_sketches()
+    for path in paths:
+        for field, digest in load_sketches(path).items():
+            merged[field].merge(digest)
+    return merged
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
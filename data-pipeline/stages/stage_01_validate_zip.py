@@ -1,43 +1,189 @@
 #!/usr/bin/env python3
 
 # This stage does the following:
-# Validate that the set of ZIP files to be processed contains the expected CSV files without
-#   any extra data such as extreneous files or directories.
+# Validate the set of ZIP files to be processed in a single parallel pass:
+#   - every ZIP opens and only contains CSV files named like the Citi Bike exports, without
+#     extra data such as extraneous files or directories
+#   - every CSV in every ZIP has the same set of columns
+#   - a sample of rows from every CSV has parseable timestamps, coordinates and categories
 #
-# Later states of this pipeline are somewhat naive and will fail if there are invalid CSV files
-#   or temporary files, hidden files, or OS-generated metadata files.
+# Later states of this pipeline are somewhat naive and will fail if there are invalid CSV files,
+#   missing or inconsistent columns, or temporary files, hidden files, or OS-generated metadata files.
+#
+# Results are cached per ZIP, keyed by size and mtime, with a fingerprint of the ZIP's member
+#   names/CRCs/sizes as a fallback, so unchanged inputs are not reopened on later runs. The cache
+#   lives in the intermediate root (see intermediate.py), which is neither published nor wiped
+#   on a fresh run.
+#   ZIPs that failed to open or read are never cached and are validated again on every run.
 
 import sys
-import logging
-from pathlib import Path
+import csv
+import json
+import hashlib
 import zipfile
 import re
+from itertools import islice
+from datetime import datetime
+from multiprocessing import Pool, cpu_count
+
+from stages.intermediate import get_intermediate_dir
 
 if __name__ == "__main__":
   print("Do not run this stage interactively.")
   sys.exit(1)
 
-def find_zip_files(input_dir):
-  print(f"Looking for ZIP file at {input_dir}")
-  for zip_file in list(input_dir.glob("*.zip")):
-    if validate_zip(input_dir, zip_file) == False:
-      return False
-  return True
-
-def validate_zip(input_dir, zip_name):
-  csv_pattern = re.compile(r"^\d{6}-citibike-tripdata_\d+\.csv$")
-  print(f"Validating ZIP file {input_dir}/{zip_name}...")
-  zip_path = input_dir / zip_name
+CACHE_FILE = ".validation_cache.json"
+CACHE_VERSION = 1
+CSV_PATTERN = re.compile(r"^\d{6}-citibike-tripdata_\d+\.csv$")
+SAMPLE_ROWS = 1000
+# Warn when more than this fraction of sampled rows fail the type checks
+MAX_BAD_FRACTION = 0.01
+
+def parse_timestamp(value):
+  try:
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+  except ValueError:
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+# Check that a sampled row has the types the later stages expect
+def row_is_sane(row):
+  try:
+    parse_timestamp(row['started_at'])
+    parse_timestamp(row['ended_at'])
+    for key in ('start_lat', 'start_lng', 'end_lat', 'end_lng'):
+      if row[key]:
+        float(row[key])
+  except (KeyError, TypeError, ValueError):
+    return False
+  return row.get('member_casual') in ('member', 'casual') and bool(row.get('rideable_type'))
+
+# Cheap content fingerprint from the ZIP's central directory: member names, CRCs and sizes
+def zip_fingerprint(zf):
+  digest = hashlib.sha256()
+  for info in sorted(zf.infolist(), key=lambda i: i.filename):
+    digest.update(f"{info.filename}\0{info.CRC:08x}\0{info.file_size}\n".encode('utf-8'))
+  return digest.hexdigest()
+
+# Validate a single ZIP: names, per-CSV headers and a sample of rows
+def validate_zip(args):
+  zip_path, cached = args
+  stat = zip_path.stat()
+  entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "fingerprint": None, "result": None}
+
   try:
     with zipfile.ZipFile(zip_path, 'r') as zf:
-      invalid_files = [f for f in zf.namelist() if not csv_pattern.match(f)]
-      if invalid_files:
-        print(f"Warning: {input_dir}/{zip_name} contains invalid contents:")
-        print("\n".join(f"  - {f}" for f in invalid_files))
+      entry["fingerprint"] = zip_fingerprint(zf)
+      # The file was touched but its contents did not change
+      if cached and cached.get("fingerprint") == entry["fingerprint"]:
+        entry["result"] = cached["result"]
+        return zip_path.name, entry, True
+
+      result = {"error": None, "invalid_files": [], "headers": {}, "sampled_rows": {}, "bad_rows": {}}
+      for name in zf.namelist():
+        if not CSV_PATTERN.match(name):
+          result["invalid_files"].append(name)
+        if not name.endswith('.csv'):
+          continue
+
+        with zf.open(name) as f:
+          lines = (line.decode('utf-8') for line in islice(f, SAMPLE_ROWS + 1))
+          reader = csv.reader(lines)
+          header = next(reader, [])
+          result["headers"][name] = header
+          sampled = bad = 0
+          for values in reader:
+            sampled += 1
+            if len(values) != len(header) or not row_is_sane(dict(zip(header, values))):
+              bad += 1
+          result["sampled_rows"][name] = sampled
+          result["bad_rows"][name] = bad
   except zipfile.BadZipFile:
-    print(f"Error: {zip_name} is not a valid ZIP file.")
+    result = {"error": "not a valid ZIP file"}
   except Exception as e:
-    print(f"Error: Unspecified error {e}")
+    result = {"error": f"unspecified error {e}"}
+
+  entry["result"] = result
+  return zip_path.name, entry, False
+
+def load_cache(cache_path):
+  if cache_path.exists():
+    try:
+      with open(cache_path, "r", encoding="utf-8") as f:
+        cache = json.load(f)
+      if cache.get("version") == CACHE_VERSION:
+        return cache["zips"]
+    except (ValueError, KeyError):
+      pass
+  return {}
+
+# An errored result may come from a transient read failure, so only successful results are kept
+def is_cacheable(entry):
+  return entry is not None and not entry["result"].get("error")
+
+def save_cache(cache_path, zips):
+  tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+  zips = {name: entry for name, entry in zips.items() if is_cacheable(entry)}
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump({"version": CACHE_VERSION, "zips": zips}, f)
+  tmp_path.replace(cache_path)
+
+# Report the per-ZIP results and check the columns across all ZIPs. Returns False on any error.
+def check_results(results):
+  ok = True
+  reference = None
+
+  for zip_name in sorted(results):
+    result = results[zip_name]["result"]
+    if result["error"]:
+      print(f"Error: {zip_name}: {result['error']}.")
+      ok = False
+      continue
+
+    if result["invalid_files"]:
+      print(f"Warning: {zip_name} contains invalid contents:")
+      print("\n".join(f"  - {f}" for f in result["invalid_files"]))
+
+    for csv_name, header in sorted(result["headers"].items()):
+      if reference is None:
+        reference = (set(header), f"{zip_name}/{csv_name}")
+      elif set(header) != reference[0]:
+        print(f"Error: CSV file {csv_name} in '{zip_name}' has different columns than {reference[1]}:")
+        print(f"  missing: {sorted(reference[0] - set(header))}, extra: {sorted(set(header) - reference[0])}")
+        ok = False
+
+      sampled = result["sampled_rows"][csv_name]
+      bad = result["bad_rows"][csv_name]
+      if sampled and bad / sampled > MAX_BAD_FRACTION:
+        print(f"Warning: {bad} of {sampled} sampled rows in {zip_name}/{csv_name} have unexpected values.")
+
+  return ok
 
 def run(input_dir, work_dir, output_dir):
-  return find_zip_files(input_dir)
\ No newline at end of file
+  print(f"Looking for ZIP files at {input_dir}")
+  zip_paths = sorted(input_dir.glob("*.zip"))
+  cache_path = get_intermediate_dir(output_dir) / CACHE_FILE
+  cache_path.parent.mkdir(parents=True, exist_ok=True)
+  cache = load_cache(cache_path)
+
+  results = {}
+  to_validate = []
+  for zip_path in zip_paths:
+    stat = zip_path.stat()
+    cached = cache.get(zip_path.name)
+    if not is_cacheable(cached):
+      cached = None
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+      results[zip_path.name] = cached
+    else:
+      to_validate.append((zip_path, cached))
+
+  print(f"Found {len(zip_paths)} ZIP files, {len(results)} unchanged since the last validation.")
+
+  if to_validate:
+    with Pool(processes=min(len(to_validate), cpu_count())) as pool:
+      for zip_name, entry, reused in pool.imap_unordered(validate_zip, to_validate):
+        print(f"{'Unchanged contents' if reused else 'Validated'}: {input_dir}/{zip_name}")
+        results[zip_name] = entry
+
+  save_cache(cache_path, results)
+  return check_results(results)
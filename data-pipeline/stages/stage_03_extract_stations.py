@@ -12,14 +12,12 @@ import re
 from datetime import datetime
 from pathlib import Path
 
-def extract_unique_stations(zip_dir, output_csv_path):
+from stages.sampling import get_sample_fraction, keep_ride
+
+def extract_unique_stations(zip_dir, output_csv_path, sample_fraction=None):
     unique_stations = {}
     row_counter = 0
 
-    # Set to -1 to scan all stations or a positive integer to terminate this
-    # stage after some number of unique stations have been identified.
-    max_rows = -1
-
     def print_progress(count):
         sys.stdout.write(f'\rProcessed rows: {count:,}')
         sys.stdout.flush()
@@ -48,9 +46,9 @@ def extract_unique_stations(zip_dir, output_csv_path):
                         if row_counter % 50000 == 0:
                             print_progress(row_counter)
 
-                        if max_rows > 0 and row_counter >= max_rows:
-                            print(f"Reached the target row count of {max_rows} and aborting.")
-                            break
+                        # Only look at sampled rides so stations match what stage_04 keeps
+                        if not keep_ride(row, sample_fraction):
+                            continue
 
                         for station_type in ['start', 'end']:
                             try:
@@ -92,7 +90,7 @@ def extract_unique_stations(zip_dir, output_csv_path):
     print(f'Done. Saved to {output_csv_path}')
 
 def run(input_dir, work_dir, output_dir):
-    extract_unique_stations(input_dir, Path(output_dir, "station_list.csv"))
+    extract_unique_stations(input_dir, Path(output_dir, "station_list.csv"), get_sample_fraction())
 
 if __name__ == "__main__":
     print("Do not run this script interactively.")
\ No newline at end of file
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
 # This stage does the following:
-# Extract a list of stations by examining all rows in the input CSV files to populate
-#   the station_list.csv file used by later stages.
+# Split the input rides into one CSV per station and month, recoding and trimming the columns,
+#   then sort each of those files by started_at and write its per-day offset index
+#   (see day_index.py).
+#
+# Each ZIP is first split into its own shard files under work_dir, then the shards for each
+#   station/month are merged into the output. Both steps are journaled (see checkpoint.py),
+#   so a restarted run only redoes the ZIPs and output files that had not finished.
 
 
 import csv
 import os
+import shutil
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime
 from zipfile import ZipFile
@@ -14,16 +21,48 @@ from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
 from math import radians, sin, cos, sqrt, atan2
 
+from stages.day_index import write_sorted_csv, started_at_key, get_index_path
+from stages.sampling import get_sample_fraction, keep_ride
+from stages.checkpoint import Journal
+
 def run(input_dir, work_dir, output_dir):
     valid_stations = load_station_ids(Path(f'{output_dir}/station_list.csv'))
     zip_files = sorted(input_dir.glob('*.zip'))
     print(f"Found {len(zip_files)} zip files. Loaded {len(valid_stations)} known station IDs.")
 
-    args = [(zip_path, valid_stations, output_dir) for zip_path in zip_files]
+    journal = Journal(work_dir, __name__)
+    shard_root = work_dir / "stage_04"
+    sample_fraction = get_sample_fraction()
+
+    pending_zips = [z for z in zip_files if not journal.is_done(f"zip:{z.name}")]
+    if len(pending_zips) < len(zip_files):
+        print(f"[RESUME] {len(zip_files) - len(pending_zips)} ZIPs already split, skipping them.")
+    args = [(zip_path, valid_stations, shard_root / zip_path.stem, sample_fraction) for zip_path in pending_zips]
 
     with Pool(processes=cpu_count()) as pool:
-        list(tqdm(pool.imap_unordered(process_zip, args),
-                  total=len(zip_files), desc="Processing ZIPs"))
+        for zip_name, shard_files in tqdm(pool.imap_unordered(process_zip, args),
+                                          total=len(args), desc="Processing ZIPs"):
+            journal.record(f"zip:{zip_name}", shard_files)
+
+    # Group the shards of every ZIP by station/month, then merge and sort each group
+    shards = defaultdict(list)
+    for zip_path in zip_files:
+        shard_dir = shard_root / zip_path.stem
+        for shard in sorted(shard_dir.rglob('*/*/*.csv')):
+            shards[shard.relative_to(shard_dir)].append(shard)
+
+    pending = [(files, output_dir / relative_path) for relative_path, files in sorted(shards.items())
+               if not journal.is_done(f"file:{relative_path}")]
+    if len(pending) < len(shards):
+        print(f"[RESUME] {len(shards) - len(pending)} station/month files already written, skipping them.")
+
+    with Pool(processes=cpu_count()) as pool:
+        for output_path in tqdm(pool.imap_unordered(merge_shards, pending),
+                                total=len(pending), desc="Sorting station/month files"):
+            journal.record(f"file:{output_path.relative_to(output_dir)}",
+                           [output_path, get_index_path(output_path)])
+
+    shutil.rmtree(shard_root, ignore_errors=True)
 
 # Load list of known station IDs
 def load_station_ids(station_list_path):
@@ -107,13 +146,14 @@ def transform_row(row, current_station_id):
 
     return row
 
-# Process a single zip file
+# Process a single zip file into its own shard directory
 def process_zip(args):
-    zip_path, valid_stations, output_dir = args
+    zip_path, valid_stations, shard_dir, sample_fraction = args
     output_buffers = {}  # {(station_id, year, month): [rows]}
     total_rows = 0
     bad_rows = 0
     skipped_station_rows = 0
+    unsampled_rows = 0
 
     with ZipFile(zip_path, 'r') as z:
         for filename in z.namelist():
@@ -126,6 +166,10 @@ def process_zip(args):
 
                 for row in reader:
                     total_rows += 1
+                    if not keep_ride(row, sample_fraction):
+                        unsampled_rows += 1
+                        continue
+
                     started_at = row.get('started_at')
                     start_id = row.get('start_station_id')
                     end_id = row.get('end_station_id')
@@ -155,17 +199,37 @@ def process_zip(args):
                         key = (station_id, dt.year, dt.month)
                         output_buffers.setdefault(key, []).append(transformed)
 
+    # Anything left from an interrupted attempt at this ZIP is stale
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+    written = []
     for (station_id, year, month), rows in output_buffers.items():
-        output_path = get_output_path(station_id, year, month, output_dir)
+        output_path = get_output_path(station_id, year, month, shard_dir)
         os.makedirs(output_path.parent, exist_ok=True)
-        write_header = not output_path.exists()
-        with open(output_path, 'a', newline='', encoding='utf-8') as f_out:
+        with open(output_path, 'w', newline='', encoding='utf-8') as f_out:
             writer = csv.DictWriter(f_out, fieldnames=rows[0].keys())
-            if write_header:
-                writer.writeheader()
+            writer.writeheader()
             writer.writerows(rows)
+        written.append(output_path)
+
+    print(f"[{zip_path.name}] Processed {total_rows} rows, {bad_rows} bad format, {skipped_station_rows} with unknown stations, {unsampled_rows} not sampled.")
+    return zip_path.name, written
+
+# Merge the shards of one station/month, sort them by started_at and write the output and its day index
+def merge_shards(args):
+    shard_files, output_path = args
+    fieldnames = None
+    rows = []
+    for shard in shard_files:
+        with open(shard, 'r', newline='', encoding='utf-8') as f_in:
+            reader = csv.DictReader(f_in)
+            fieldnames = fieldnames or reader.fieldnames
+            rows.extend(reader)
+
+    rows.sort(key=started_at_key)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_sorted_csv(output_path, fieldnames, rows)
+    return output_path
 
-    print(f"[{zip_path.name}] Processed {total_rows} rows, {bad_rows} bad format, {skipped_station_rows} with unknown stations.")
-    
 if __name__ == '__main__':
     print("Do not run this script interactively.")
@@ -4,126 +4,164 @@ import os
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
-import shutil
+from collections import defaultdict
+
+from stages.sketch import SKETCH_FIELDS, TDigest, new_sketches, save_sketches, save_station_sketches, load_sketches
+from stages.checkpoint import Journal
+from stages.day_index import track_day, save_day_index, get_index_path
 
 # Directory containing Stage 3 data
 STAGE3_DIR = Path('../../private/stage3')
 # Directory to save the JSON files in Stage 4
 STAGE4_DIR = Path('../../private/stage4')
 
-# Function to convert CSV to JSON and calculate the new variables
-def process_file(args):
-    file, work_dir = args
-    # Get the relative path within stage3, which includes the subdirectories (station_id, year, month)
-    relative_path = file.relative_to(work_dir)
-
-    # Create the target directory in stage4 by extracting the appropriate parts of the relative path
-    target_file = work_dir / relative_path.with_suffix('.json')
-    target_file.parent.mkdir(parents=True, exist_ok=True)
+# Every file starts with the same header so the rides array always begins at a fixed offset;
+#   the summary is only known once all rides are read, so it is written after them
+RIDES_HEADER = '{"rides":['
+encode_json = json.JSONEncoder(separators=(',', ':')).encode
 
-    # Read the CSV file and calculate metrics
+# Stream one station/month CSV into the JSON payload served to the frontend, one ride at a time,
+#   and return the summary, the ride_time/ride_distance quantile sketches of all rides and of the
+#   departures only (see sketch.py), and the per-day byte offsets of the rides (see day_index.py)
+def write_output_data(file, f_out):
     total_inbound = 0
     total_outbound = 0
-    rides = []
+    sketches = new_sketches()
+    departures = new_sketches()
+    days = []
 
+    # encode_json escapes non-ASCII characters, so string lengths are byte lengths
+    f_out.write(RIDES_HEADER)
+    offset = len(RIDES_HEADER)
     with open(file, 'r', newline='', encoding='utf-8') as f_in:
         reader = csv.DictReader(f_in)
-        
-        for row in reader:
+
+        for n, row in enumerate(reader):
             direction = int(row['direction'])
             if direction == 1:
                 total_inbound += 1
             elif direction == 0:
                 total_outbound += 1
-            rides.append(row)
-
-    # Calculate bike flux
-    bike_flux = total_inbound - total_outbound
-
-    # Prepare the data to be saved in JSON
-    output_data = {
-        "rides": rides,  # All ride data from CSV
-        "summary": {
-            "total_inbound": total_inbound,
-            "total_outbound": total_outbound,
-            "flux": bike_flux
-        }
+            if n:
+                f_out.write(',')
+                offset += 1
+            encoded = encode_json(row)
+            f_out.write(encoded)
+            track_day(days, row['started_at'][:10], offset, len(encoded), n)
+            offset += len(encoded)
+
+            for field in SKETCH_FIELDS:
+                try:
+                    value = float(row[field])
+                except (KeyError, ValueError, TypeError):
+                    continue
+                sketches[field].add(value)
+                if direction != 1:
+                    departures[field].add(value)
+
+    summary = {
+        "total_inbound": total_inbound,
+        "total_outbound": total_outbound,
+        "flux": total_inbound - total_outbound,
+        **{field: sketches[field].summary() for field in SKETCH_FIELDS}
     }
+    f_out.write('],"summary":' + encode_json(summary) + '}')
 
-    # Save to JSON file
-    with open(target_file, 'w', encoding='utf-8') as f_out:
-        json.dump(output_data, f_out, indent=4)
+    return summary, sketches, departures, days
+
+# Function to convert CSV to JSON and calculate the new variables
+def process_file(file):
+    # The JSON is written next to its station/month CSV
+    target_file = file.with_suffix('.json')
+
+    # Write to a temp file and rename it into place so a reader never sees a partial file
+    tmp_file = target_file.with_name(target_file.name + '.tmp')
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f_out:
+            _, sketches, departures, days = write_output_data(file, f_out)
+        os.replace(tmp_file, target_file)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+    save_day_index(target_file, len(RIDES_HEADER), days)
+
+    save_station_sketches(get_sketch_path(target_file), sketches, departures)
+
+    # Return the file and its serialized departure sketches so the parent can journal it and build
+    # system-wide distributions from exactly what a resumed run would load from the sidecar
+    return file, {field: digest.to_dict() for field, digest in departures.items()}
+
+def get_sketch_path(json_file):
+    return json_file.with_suffix('.sketch.json')
+
+# Merge station/month departure sketches into system-wide monthly and yearly sketches
+def save_system_sketches(results, output_dir):
+    monthly = defaultdict(new_sketches)
+    for month, sketches in results:
+        for field, digest in sketches.items():
+            monthly[month][field].merge(digest)
+
+    yearly = defaultdict(new_sketches)
+    for month, sketches in sorted(monthly.items()):
+        save_sketches(output_dir / f"{month}-sketch.json", sketches)
+        for field, digest in sketches.items():
+            yearly[month[:4]][field].merge(digest)
+
+    for year, sketches in sorted(yearly.items()):
+        save_sketches(output_dir / f"{year}-sketch.json", sketches)
 
 # Function to process each station directory (returning a list of CSV files to process)
-def get_csv_files_to_process(work_dir):
+def get_csv_files_to_process(output_dir):
     files_to_process = []
-    # Traverse all directories and subdirectories under stage3
-    for station_dir in work_dir.rglob('*/*/*.csv'):  # This matches the input structure
+    # Traverse all station directories under output_dir
+    for station_dir in output_dir.rglob('*/*/*.csv'):  # This matches the input structure
         if station_dir.is_file():
             files_to_process.append(station_dir)
-    return files_to_process
+    return sorted(files_to_process)
 
 # Function to process files in parallel with a progress bar
-def process_stage3_files_parallel(work_dir):
-    files_to_process = get_csv_files_to_process(work_dir)
-    
+def process_files_parallel(output_dir, work_dir):
+    files_to_process = get_csv_files_to_process(output_dir)
+
     print(f"Found {len(files_to_process)} files to process.")
 
     if len(files_to_process) == 0:
         print("No files found to process. Please check the directory structure.")
         return
 
+    # Files converted before an interrupted run are skipped, and their saved sketches reused
+    journal = Journal(work_dir, __name__)
+    results = {}  # {file: departure sketches}
+    pending = []
+    for file in files_to_process:
+        if journal.is_done(file.relative_to(output_dir)):
+            results[file] = load_sketches(get_sketch_path(file.with_suffix('.json')))
+        else:
+            pending.append(file)
+    if results:
+        print(f"[RESUME] {len(results)} files already converted, skipping them.")
+
     # Use a pool of workers, twice the number of CPU cores
     num_workers = 2 * cpu_count()
 
-    args_list = [(fname, work_dir) for fname in files_to_process]
-
-
     # Use tqdm for the progress bar
     with Pool(processes=num_workers) as pool:
-        list(tqdm(pool.imap(process_file, args_list), total=len(args_list), desc="Processing Files"))
+        for file, sketches in tqdm(pool.imap_unordered(process_file, pending), total=len(pending), desc="Processing Files"):
+            target_file = file.with_suffix('.json')
+            journal.record(file.relative_to(output_dir),
+                           [target_file, get_index_path(target_file), get_sketch_path(target_file)])
+            results[file] = {field: TDigest.from_dict(data) for field, data in sketches.items()}
 
-    print("Stage 3 files processed and converted to JSON in Stage 4 successfully.")
+    # Merge in file order so the system-wide sketches do not depend on worker timing
+    save_system_sketches([(file.name[:7], results[file]) for file in sorted(results)], output_dir)
+
+    print("Station/month files converted to JSON successfully.")
 
 def run(input_dir, work_dir, output_dir):
-    # As the first step, copy the contents of output_dir to work_dir
-    if work_dir.exists():
-        shutil.rmtree(work_dir)
-    work_dir.mkdir(parents=True, exist_ok=True)
-
-    if output_dir.exists():
-        print(f"[COPY] Syncing {output_dir} to {work_dir}")
-        for item in output_dir.iterdir():
-            dest = work_dir / item.name
-            if item.is_dir():
-                shutil.copytree(item, dest, dirs_exist_ok=True)
-            else:
-                shutil.copy2(item, dest)
-    
-    process_stage3_files_parallel(work_dir)
-
-    # If were still running things are good, copy work_dir to output_dir
-    print(f"[COPY] Syncing {work_dir} to {output_dir}")
-    if not output_dir.exists():
-        output_dir.mkdir(parents=True)
-    for item in work_dir.iterdir():
-        dest = output_dir / item.name
-        if item.is_dir():
-            shutil.copytree(item, dest, dirs_exist_ok=True)
-        else:
-            shutil.copy2(item, dest)
-
-    # Clean up all csv files from station data directories in output_dir/*/*/
-    #files_to_process = get_csv_files_to_process(work_dir)
-    #for f in files_to_process:
-    #    try:
-    #        Path(output_dir, f).unlink()
-    #    except FileNotFoundError:
-    #        pass
-    #    except Exception as e:
-    #        print(f"[Error]: Stage 06 unable to remove input csv file {output_dir}/{f}")
-    #        pass
-        
+    # Every JSON file is written atomically next to its CSV, so there is no need to stage a copy in work_dir
+    process_files_parallel(output_dir, work_dir)
+
 # Run the parallel processing function
 if __name__ == "__main__":
     print("Do not run this script interactively.")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# This stage does the following:
+# Build a sparse origin-destination matrix per month from the station/month CSVs, split by
+#   member_casual and rideable_type. See od_matrix.py for the on-disk format.
+#
+# Every ride is counted once, from the CSV of its start station (direction 0 or 2), so each
+#   station/month CSV holds exactly one row of that month's matrix.
+#
+# Months are built one at a time and journaled (see checkpoint.py), so a restarted run only
+#   rebuilds the months that were not saved.
+
+import csv
+from pathlib import Path
+from collections import defaultdict, Counter
+from multiprocessing import Pool, cpu_count
+from tqdm import tqdm
+
+from stages.station_codes import load_station_codes
+from stages.od_matrix import build_od_matrix, save_od_matrix
+from stages.checkpoint import Journal
+
+# Count outbound rides in one station/month CSV: (month, station_id, Counter of (end_id, member, bike))
+def process_file(path):
+    counts = Counter()
+    month = path.name[:7]
+    station_id = path.parent.name
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if row.get('direction') not in ('0', '2'):
+                continue
+            key = (row['end_station_id'], int(row['member_casual']), int(row['rideable_type']))
+            counts[key] += 1
+
+    return month, station_id, counts
+
+def get_od_matrix_path(month, output_dir):
+    return Path(output_dir) / f"{month}-od-matrix.npz"
+
+def run(input_dir, work_dir, output_dir):
+    station_ids, codes = load_station_codes(output_dir)
+    csv_files = sorted(output_dir.rglob("*/*/*-ridedata.csv"))
+    print(f"Found {len(csv_files)} station/month files. Loaded {len(station_ids)} station codes.")
+
+    files_by_month = defaultdict(list)
+    for path in csv_files:
+        files_by_month[path.name[:7]].append(path)
+
+    journal = Journal(work_dir, __name__)
+
+    with Pool(processes=2 * cpu_count()) as pool:
+        for month, month_files in sorted(files_by_month.items()):
+            matrix_path = get_od_matrix_path(month, output_dir)
+            if journal.is_done(month):
+                print(f"[{month}] [RESUME] OD matrix already built, skipping.")
+                continue
+
+            # {start_code -> Counter of (end_code, member, bike)}
+            rows = {}
+            unknown = 0
+            for _, station_id, counts in tqdm(pool.imap_unordered(process_file, month_files),
+                                              total=len(month_files), desc=f"Counting {month} OD pairs"):
+                if station_id not in codes:
+                    unknown += sum(counts.values())
+                    continue
+                row = rows.setdefault(codes[station_id], Counter())
+                for (end_id, member, bike), count in counts.items():
+                    if end_id not in codes:
+                        unknown += count
+                        continue
+                    row[(codes[end_id], member, bike)] += count
+
+            if unknown:
+                print(f"Warning: skipped {unknown} rides in {month} with stations missing from station_list.csv")
+
+            matrix = build_od_matrix(station_ids, rows)
+            save_od_matrix(matrix_path, matrix)
+            journal.record(month, [matrix_path])
+            print(f"[{month}] {len(matrix.indices)} station pairs, {int(matrix.data.sum())} rides")
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,31 @@
+import json
+from pathlib import Path
+from stages.od_matrix import load_od_matrix
+
+# Save results to correct path format
+def save_top_50(month, matrix, output_dir):
+    formatted = [
+        {
+            "start_station_id": sid,
+            "end_station_id": eid,
+            "count": count
+        }
+        for sid, eid, count in matrix.top_routes(50)
+    ]
+    out_path = output_dir / f"{month}-top-50.json"
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(formatted, f, indent=4)
+
+# Main pipeline
+def run(input_dir, work_dir, output_dir):
+    # Top routes are read straight from the monthly OD matrices built by stage_07
+    matrix_files = sorted(Path(output_dir).glob("*-od-matrix.npz"))
+
+    for path in matrix_files:
+        month = path.name[:7]
+        save_top_50(month, load_od_matrix(path), output_dir)
+
+    print(f"✅ Top 50 outbound rides per month written to {output_dir} from {len(matrix_files)} OD matrices.")
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# This stage does the following:
+# Build a dense ride count cube per month (direction x station x hour x weekday x member x bike)
+#   from the station/month CSVs, so network-wide and per-station breakdowns can be summed
+#   without rescanning rides. See data_cube.py for the format and query helpers.
+#
+# Months are built one at a time and journaled (see checkpoint.py), so a restarted run only
+#   rebuilds the months that were not saved.
+
+import csv
+from datetime import date
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+from tqdm import tqdm
+import numpy as np
+
+from stages.station_codes import load_station_codes
+from stages.data_cube import DIRECTIONS, empty_station_cube, save_cube, get_cube_paths
+from stages.checkpoint import Journal
+
+# Count the rides in one station/month CSV into that station's slice of the cube
+def process_file(path):
+    counts = empty_station_cube()
+    weekdays = {}
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            started_at = row['started_at']
+            day = started_at[:10]
+            if day not in weekdays:
+                weekdays[day] = date.fromisoformat(day).weekday()
+            cell = (int(started_at[11:13]), weekdays[day], int(row['member_casual']), int(row['rideable_type']))
+
+            direction = row['direction']
+            if direction in ('0', '2'):
+                counts[(DIRECTIONS["departures"],) + cell] += 1
+            if direction in ('1', '2'):
+                counts[(DIRECTIONS["arrivals"],) + cell] += 1
+
+    return path.name[:7], path.parent.name, counts
+
+def run(input_dir, work_dir, output_dir):
+    station_ids, codes = load_station_codes(output_dir)
+    csv_files = sorted(output_dir.rglob("*/*/*-ridedata.csv"))
+    print(f"Found {len(csv_files)} station/month files. Loaded {len(station_ids)} station codes.")
+
+    files_by_month = defaultdict(list)
+    for path in csv_files:
+        files_by_month[path.name[:7]].append(path)
+
+    journal = Journal(work_dir, __name__)
+
+    with Pool(processes=2 * cpu_count()) as pool:
+        for month, month_files in sorted(files_by_month.items()):
+            if journal.is_done(month):
+                print(f"[{month}] [RESUME] Data cube already built, skipping.")
+                continue
+
+            cube = np.zeros((2, len(station_ids), 24, 7, 2, 2), dtype=np.uint32)
+            for _, station_id, counts in tqdm(pool.imap_unordered(process_file, month_files),
+                                              total=len(month_files), desc=f"Building {month} data cube"):
+                if station_id not in codes:
+                    print(f"Warning: skipping {station_id}, not in station_list.csv")
+                    continue
+                cube[:, codes[station_id]] = counts
+
+            save_cube(month, output_dir, station_ids, cube)
+            journal.record(month, get_cube_paths(month, output_dir))
+            print(f"[{month}] Saved data cube with {int(cube[0].sum())} departures")
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
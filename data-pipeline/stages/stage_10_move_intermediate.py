@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+# This stage does the following:
+# Move all month level ridership CSVs and their day indexes out of the station directories in the
+#   output folder into the intermediate root (see intermediate.py), where serve.py's on-demand mode reads them
+
+import re
+import shutil
+from pathlib import Path
+
+from stages.intermediate import get_intermediate_dir
+
+def run(input_dir, work_dir, output_dir):
+    """
+    Move all files in output_dir matching pattern YYYY-MM-ridedata.csv or YYYY-MM-ridedata.csv.idx
+    to the same relative path under the intermediate root
+    """
+    pattern = re.compile(r"^\d{4}-\d{2}-ridedata\.csv(\.idx)?$")
+    intermediate_dir = get_intermediate_dir(output_dir)
+
+    moved = 0
+    for path in Path(output_dir).rglob("*.csv*"):
+        if pattern.match(path.name):
+            target = intermediate_dir / path.relative_to(output_dir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(path, target)
+            moved += 1
+
+    print(f"[INTERMEDIATE] Moved {moved} files from {output_dir} to {intermediate_dir}")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# This stage does the following:
+# Write one bundle file per month that concatenates every station's ride data JSON, plus a
+#   station -> (offset, length, per-day offsets) index and one file with every station's sketches,
+#   so the month can be deployed as three files instead of several small files per station.
+#   See bundle.py for the format and a reader.
+#
+# The per-station JSON, day index and sketch files are left in place; this is an alternative
+#   layout of the same data.
+#
+# Finished bundles are journaled (see checkpoint.py), so a restarted run only rebuilds the
+#   months that were not written.
+
+import json
+import os
+import re
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+from tqdm import tqdm
+
+from stages.bundle import get_bundle_path, get_index_path, get_sketches_path
+from stages.day_index import load_day_index
+from stages.stage_06_convert_to_json import get_sketch_path
+from stages.checkpoint import Journal
+
+BUNDLE_DIR = "bundles"
+
+# Write data to a temp file next to path, to be renamed into place with the rest of the bundle
+def write_tmp_json(path, data):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return tmp_path
+
+# Concatenate the given station files into one month bundle and write its index and sketches
+def write_bundle(args):
+    month, station_files, bundle_dir = args
+    bundle_path = get_bundle_path(month, bundle_dir)
+    tmp_path = bundle_path.with_name(bundle_path.name + ".tmp")
+    stations = {}
+    sketches = {}
+
+    offset = 0
+    with open(tmp_path, 'wb') as f_out:
+        for station_id, path in station_files:
+            with open(path, 'rb') as f_in:
+                payload = f_in.read()
+            f_out.write(payload)
+            stations[station_id] = [offset, len(payload), load_day_index(path)["days"]]
+            offset += len(payload)
+            with open(get_sketch_path(path), 'r', encoding='utf-8') as f_sketch:
+                sketches[station_id] = json.load(f_sketch)
+
+    index_path = get_index_path(bundle_path)
+    tmp_index = write_tmp_json(index_path, {"bundle": bundle_path.name, "stations": stations})
+    sketches_path = get_sketches_path(month, bundle_dir)
+    tmp_sketches = write_tmp_json(sketches_path, sketches)
+
+    os.replace(tmp_path, bundle_path)
+    os.replace(tmp_index, index_path)
+    os.replace(tmp_sketches, sketches_path)
+    return month, len(stations), offset
+
+def run(input_dir, work_dir, output_dir):
+    pattern = re.compile(r"^(\d{4}-\d{2})-ridedata\.json$")
+    months = defaultdict(list)
+    for path in sorted(Path(output_dir).rglob("*/*/*-ridedata.json")):
+        match = pattern.match(path.name)
+        if match:
+            months[match.group(1)].append((path.parent.name, path))
+
+    bundle_dir = Path(output_dir) / BUNDLE_DIR
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    journal = Journal(work_dir, __name__)
+    args = [(month, files, bundle_dir) for month, files in sorted(months.items()) if not journal.is_done(month)]
+    if len(args) < len(months):
+        print(f"[RESUME] {len(months) - len(args)} months already bundled, skipping them.")
+
+    with Pool(processes=min(len(args), cpu_count()) or 1) as pool:
+        for month, n_stations, size in tqdm(pool.imap_unordered(write_bundle, args),
+                                            total=len(args), desc="Bundling months"):
+            bundle_path = get_bundle_path(month, bundle_dir)
+            journal.record(month, [bundle_path, get_index_path(bundle_path), get_sketches_path(month, bundle_dir)])
+            print(f"[{month}] Bundled {n_stations} stations into {size:,} bytes")
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")
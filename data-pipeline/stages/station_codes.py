@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+# Helpers shared by the stages that store per-station data in NumPy arrays.
+#
+# Stations are addressed by an integer code, which is simply the row position of the
+#   station in station_list.csv (written by stage_03). Every array product saves the
+#   ordered list of station IDs next to the data so the codes can always be mapped back.
+
+import csv
+from pathlib import Path
+
+# Load the ordered list of station IDs and a lookup of station ID -> integer code
+def load_station_codes(output_dir):
+    station_ids = []
+    with open(Path(output_dir, "station_list.csv"), newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            station_id = row.get('station_id')
+            if station_id:
+                station_ids.append(station_id)
+    codes = {station_id: code for code, station_id in enumerate(station_ids)}
+    return station_ids, codes
+
+if __name__ == "__main__":
+    print("Do not run this script interactively.")